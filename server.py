@@ -10,19 +10,29 @@ Usage:
     python api-server.py
 
 Requirements:
-    pip install flask flask-cors flask-socketio requests
+    pip install flask flask-cors flask-socketio requests orjson msgspec
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from werkzeug.exceptions import BadRequest
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import requests,json
+import orjson
+import msgspec
 import time
 import threading
-from datetime import datetime,timedelta
 import sys
 import os
-from pya3 import Aliceblue, TransactionType, OrderType, ProductType
+import functools
+import atexit
+import hashlib
+import csv
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+from collections import deque, namedtuple
+from pya3 import Aliceblue, Instrument, TransactionType, OrderType, ProductType
 
 # -----------------------------
 # Global Constants & Variables
@@ -49,17 +59,64 @@ except ImportError:
     ALICE_BLUE_AVAILABLE = False
     print("Warning: Alice Blue API not available. Running in mock mode.")
 
+class OrjsonPacketCodec:
+    """orjson-backed json module for Socket.IO packet encoding"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", json=OrjsonPacketCodec)
 
 # Create separate namespaces for different data types
 market_data_namespace = '/market-data'
 contracts_namespace = '/contracts'
 
+# Static Socket.IO message bodies (timestamps are added per emit)
+_CONNECTED_MD_MSG = {'message': 'Connected to market data stream'}
+_CONNECTED_CONTRACTS_MSG = {'message': 'Connected to contracts stream'}
+_SUBSCRIBED_MD_TMPL = {'type': 'market_data', 'message': 'Subscribed to market data updates'}
+_SUBSCRIBED_CONTRACTS_TMPL = {'type': 'contracts', 'message': 'Subscribed to contract updates'}
+_UNSUBSCRIBED_MD_TMPL = {'type': 'market_data', 'message': 'Unsubscribed from market data updates'}
+_UNSUBSCRIBED_CONTRACTS_TMPL = {'type': 'contracts', 'message': 'Unsubscribed from contract updates'}
+
+# Rooms used to broadcast ticks in a single emit
+market_data_room = 'md'            # market data namespace subscribers
+legacy_market_data_room = 'legacy'  # default namespace clients (backward compatibility)
+
+class OrderResult(msgspec.Struct, omit_defaults=True):
+    """Per-account result of a multi-account order placement"""
+    account_name: str
+    success: bool
+    order_id: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    stop_loss_orders: Optional[dict] = None
+    stop_loss_error: Optional[str] = None
+
+def _json_body():
+    """Parse the request body with orjson ({} when empty)"""
+    raw = request.get_data(cache=False)
+    if not raw:
+        return {}
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        raise BadRequest('Invalid JSON body')
+
+# Decrypted accounts grouped by Category ('Primary', 'Secondary', ...)
+accounts_by_category = {}
+
 # Configuration - Load from appsettings.json
 def load_credentials():
     """Load USER_ID and API_KEY from appsettings.json Primary account"""
+    global accounts_by_category
     try:
         with open('appsettings.json', 'r') as f:
             settings = json.load(f)
@@ -80,12 +137,14 @@ def load_credentials():
             print("Warning: Settings are encrypted but decryption utilities are not available")
             return None, None
         
-        # Find the Primary account
-        primary_account = None
+        # Index accounts by category so lookups don't rescan the list
+        accounts_by_cat = {}
         for account in alice_blue_accounts:
-            if account.get('Category') == 'Primary':
-                primary_account = account
-                break
+            accounts_by_cat.setdefault(account.get('Category'), []).append(account)
+        accounts_by_category = accounts_by_cat
+        
+        # Find the Primary account
+        primary_account = next(iter(accounts_by_cat.get('Primary', [])), None)
         
         if primary_account:
             user_id = primary_account.get('UserId', '')
@@ -106,22 +165,71 @@ def load_credentials():
 # Load credentials from appsettings.json
 USER_ID, API_KEY = load_credentials()
 
+# Shared pool for per-account broker work (sized from the accounts loaded above)
+ACCOUNT_WORKER_POOL = ThreadPoolExecutor(
+    max_workers=max(8, sum(len(accs) for accs in accounts_by_category.values())),
+    thread_name_prefix='acct'
+)
+atexit.register(ACCOUNT_WORKER_POOL.shutdown)
+
 # Global variables
 alice = None
 session_id = None
 is_connected = False
-clients_connected = set()
 websocket_running = False
 
-# Store previous values for change calculation
-previous_market_data = {
-    'nifty50': {'price': 0, 'changePercent': 0},
-    'niftyBank': {'price': 0, 'changePercent': 0}
-}
+def room_has_clients(namespace, room=None):
+    """Check Socket.IO's room registry for connected clients (room=None means the whole namespace)"""
+    return bool(socketio.server.manager.rooms.get(namespace, {}).get(room))
+
+# Latest index values. The websocket thread is the only writer and publishes a new
+# immutable snapshot on every tick; readers take one reference and never see a partial update.
+MarketSnap = namedtuple('MarketSnap', 'nifty50_price nifty50_pct bank_price bank_pct')
+market_snap = MarketSnap(0, 0, 0, 0)
+
+def build_market_snapshot():
+    """Build the market_data_update payload from the current market snapshot"""
+    snap = market_snap
+    return {
+        'type': 'market_data',
+        'data': {
+            'nifty50': {
+                'price': snap.nifty50_price,
+                'changePercent': snap.nifty50_pct
+            },
+            'niftyBank': {
+                'price': snap.bank_price,
+                'changePercent': snap.bank_pct
+            }
+        },
+        'timestamp': int(time.time() * 1000)
+    }
+
+# Last broadcast market data payload, re-sent as-is to new subscribers
+_market_snapshot_cache = build_market_snapshot()
+
+def refresh_market_snapshot():
+    """Rebuild the cached market data snapshot and return it"""
+    global _market_snapshot_cache
+    _market_snapshot_cache = build_market_snapshot()
+    return _market_snapshot_cache
 
 # Global variables for contract data
-contract_data = {}  # token -> {price, changePercent, previousPrice}
+# Contract prices are stored struct-of-arrays: one slot per token across parallel arrays
+contract_index = {}         # token -> slot
+contract_slot_tokens = []   # slot -> token
+contract_prices = array('d')
+contract_change_percents = array('d')
+contract_previous_prices = array('d')
+_contract_slot_lock = threading.Lock()
 subscribed_contract_tokens = set()  # Set of subscribed contract tokens
+nfo_instrument_by_token = None  # token -> Instrument, built on first contract subscription
+
+# The websocket thread only updates state and queues the ticked token; tick_emitter_loop
+# drains the queue and does all broadcasting. maxlen bounds memory during tick storms.
+_tick_q = deque(maxlen=4096)
+tick_emitter_running = False
+TICK_EMIT_INTERVAL = 0.02  # seconds
 
 
 def check_alice_blue_connection():
@@ -160,6 +268,7 @@ def reload_credentials():
         if new_user_id and new_api_key:
             USER_ID = new_user_id
             API_KEY = new_api_key
+            clear_alice_client_pool()
             print(f"Credentials reloaded: {USER_ID}")
             return True
         else:
@@ -169,9 +278,86 @@ def reload_credentials():
         print(f"Error reloading credentials: {e}")
         return False
 
+# Short-lived cache of serialized account data: name -> (expires_at, JSON bytes)
+_ttl_cache = {}
+
+def ttl_cached(ttl_seconds):
+    """Cache the orjson-encoded result of a no-arg fetcher for ttl_seconds"""
+    def decorator(func):
+        key = func.__name__
+        lock = threading.Lock()  # One lock per fetcher so concurrent polls share one upstream call
+
+        @functools.wraps(func)
+        def wrapper():
+            with lock:
+                cached = _ttl_cache.get(key)
+                now = time.monotonic()
+                if cached and cached[0] > now:
+                    return cached[1]
+                payload = orjson.dumps(func())
+                _ttl_cache[key] = (now + ttl_seconds, payload)
+                return payload
+        return wrapper
+    return decorator
+
+@ttl_cached(3)
+def _fetch_holdings():
+    return alice.get_holding_positions()
+
+@ttl_cached(3)
+def _fetch_funds():
+    return alice.get_balance()
+
+@ttl_cached(3)
+def _fetch_profile():
+    return alice.get_profile()
+
+# Authenticated per-account clients: (user_id, api_key) -> (Aliceblue, created_at)
+_alice_client_pool = {}
+_pool_lock = threading.Lock()
+SESSION_TTL = 8 * 60 * 60  # seconds
+
+def is_error_response(response):
+    """True if a pya3 call returned an error payload (stat other than 'Ok') instead of data"""
+    return isinstance(response, dict) and response.get('stat', 'Ok') != 'Ok'
+
+def clear_alice_client_pool():
+    """Drop every pooled client so the next get_alice_client logs in again"""
+    with _pool_lock:
+        _alice_client_pool.clear()
+
+def get_alice_client(user_id, api_key):
+    """Return an authenticated Aliceblue client for an account, or None if login fails"""
+    key = (user_id, api_key)
+    now = time.monotonic()
+    
+    with _pool_lock:
+        cached = _alice_client_pool.get(key)
+    
+    if cached and now - cached[1] < SESSION_TTL:
+        # Sessions can die well before SESSION_TTL (daily expiry, a login elsewhere), so check a
+        # pooled one with a cheap read and fall through to a fresh login if the broker rejects it
+        try:
+            if not is_error_response(cached[0].get_profile()):
+                return cached[0]
+        except Exception as e:
+            print(f"Pooled Alice Blue session check failed for {user_id}: {e}")
+        with _pool_lock:
+            if _alice_client_pool.get(key) is cached:
+                del _alice_client_pool[key]
+    
+    client = Aliceblue(user_id=user_id, api_key=api_key)
+    if client.get_session_id().get('stat') != 'Ok':
+        return None
+    
+    with _pool_lock:
+        _alice_client_pool[key] = (client, now)
+    
+    return client
+
 def initialize_alice_blue():
     """Initialize Alice Blue connection"""
-    global alice, session_id, is_connected
+    global alice, session_id, is_connected, nfo_instrument_by_token
     
     if not ALICE_BLUE_AVAILABLE:
         print("Alice Blue API not available, using mock data")
@@ -179,6 +365,9 @@ def initialize_alice_blue():
     
     try:
         alice = Aliceblue(user_id=USER_ID, api_key=API_KEY)
+        _ttl_cache.clear()
+        clear_alice_client_pool()
+        nfo_instrument_by_token = None
         session_response = alice.get_session_id()
         
         if session_response.get('stat') == 'Ok':
@@ -196,10 +385,25 @@ def initialize_alice_blue():
 initialize_alice_blue()
 
 
+def _reconnect_flow():
+    """Reconnect to Alice Blue with the reloaded credentials and restart the websocket"""
+    initialize_alice_blue()
+    
+    if is_connected:
+        start_aliceblue_websocket()
+    
+    socketio.emit('credentials_reloaded', {
+        'success': is_connected,
+        'connected': is_connected,
+        'message': 'Credentials reloaded and reconnected successfully' if is_connected
+                   else 'Credentials reloaded but failed to connect to Alice Blue',
+        'timestamp': int(time.time() * 1000)
+    })
+
 @app.route('/api/reload-credentials', methods=['POST'])
 def reload_credentials_endpoint():
-    """Reload credentials from appsettings.json and reconnect"""
-    global alice, session_id, is_connected, websocket_running
+    """Reload credentials from appsettings.json and reconnect in the background"""
+    global websocket_running
     
     try:
         # Reload credentials
@@ -215,25 +419,15 @@ def reload_credentials_endpoint():
             websocket_running = False
             print("Stopped existing WebSocket connection")
         
-        # Reinitialize Alice Blue connection with new credentials
-        initialize_alice_blue()
+        # Reconnect off the request thread; clients are notified via 'credentials_reloaded'
+        socketio.start_background_task(_reconnect_flow)
         
-        if is_connected:
-            # Restart websocket with new credentials
-            start_aliceblue_websocket()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Credentials reloaded and reconnected successfully',
-                'user_id': USER_ID,
-                'connected': is_connected
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to reconnect',
-                'message': 'Credentials reloaded but failed to connect to Alice Blue'
-            }), 400
+        return jsonify({
+            'success': True,
+            'status': 'reconnecting',
+            'message': 'Credentials reloaded, reconnecting to Alice Blue',
+            'user_id': USER_ID
+        }), 202
             
     except Exception as e:
         return jsonify({
@@ -252,7 +446,7 @@ def subscribe_contracts():
         return error_response
     
     try:
-        data = request.get_json()
+        data = _json_body()
         contract_tokens = data.get('tokens', [])
         
         if not contract_tokens:
@@ -279,6 +473,15 @@ def subscribe_contracts():
             'message': str(e)
         }), 500
 
+def _stream_orders(orders):
+    """Encode an order list as a JSON array one order at a time"""
+    yield b'['
+    first = True
+    for order in orders:
+        yield (b'' if first else b',') + orjson.dumps(order)
+        first = False
+    yield b']'
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
     """Fetch orders from AliceBlue"""
@@ -289,7 +492,10 @@ def get_orders():
 
     try:
         orders = alice.order_data()
-        return jsonify(orders)
+        if not isinstance(orders, list):
+            # Error/status payloads are a single small object
+            return Response(orjson.dumps(orders), mimetype='application/json')
+        return Response(_stream_orders(orders), mimetype='application/json', direct_passthrough=True)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch orders', 'message': str(e)}), 500
 
@@ -315,8 +521,7 @@ def get_holdings():
         return error_response
     
     try:
-        holdings = alice.get_holding_positions()
-        return jsonify(holdings)
+        return Response(_fetch_holdings(), mimetype='application/json')
     except Exception as e:
         return jsonify({
             'error': 'Failed to fetch holdings',
@@ -332,8 +537,7 @@ def get_funds():
         return error_response
     
     try:
-        balance = alice.get_balance()        
-        return jsonify(balance)
+        return Response(_fetch_funds(), mimetype='application/json')
     except Exception as e:
         return jsonify({
             'error': 'Failed to fetch balance',
@@ -348,8 +552,7 @@ def get_profile():
     if error_response:
         return error_response
     try:
-        profile = alice.get_profile()
-        return jsonify(profile)
+        return Response(_fetch_profile(), mimetype='application/json')
     except Exception as e:
         return jsonify({
             'error': 'Failed to fetch user profile',
@@ -365,10 +568,10 @@ def cancel_orders_for_account(alice, account_name):
         orders = alice.order_data()
         pending_orders = [o for o in orders if o.get('Status') in {'pending', 'open', 'trigger pending'}]
     except:
-        return {'success': False, 'message': 'Error fetching orders', 'successful': [], 'failed': []}
+        return {'success': False, 'message': 'Error fetching orders', 'successful_cancellations': [], 'failed_cancellations': []}
     
     if not pending_orders:
-        return {'success': False, 'message': 'No pending orders', 'successful': [], 'failed': []}
+        return {'success': False, 'message': 'No pending orders', 'successful_cancellations': [], 'failed_cancellations': []}
     
     # Cancel orders
     successful, failed = [], []
@@ -387,8 +590,8 @@ def cancel_orders_for_account(alice, account_name):
     return {
         'success': success,
         'message': message,
-        'successful': successful,
-        'failed': failed
+        'successful_cancellations': successful,
+        'failed_cancellations': failed
     }
 
 
@@ -429,8 +632,6 @@ def square_off_positions_for_account(alice, account_name):
             }
             
         
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        
         def square_off_position(pos):
             """Square off a single position"""
             try:
@@ -452,7 +653,10 @@ def square_off_positions_for_account(alice, account_name):
                 response = requests.post(url, headers=headers, json=payload)
 
                 if response.ok:
-                    result_data = response.json()
+                    try:
+                        result_data = orjson.loads(response.content) if response.content else {}
+                    except orjson.JSONDecodeError:
+                        result_data = {}
                     return (True, {
                         'account_name': account_name,
                         'symbol': pos.get('Tsym'),
@@ -498,6 +702,19 @@ def square_off_positions_for_account(alice, account_name):
             'failed_square_offs': []
         }
 
+def cancel_and_square_off_account(alice, account_name):
+    """Cancel pending orders, then square off positions, for a single account"""
+    return (
+        cancel_orders_for_account(alice, account_name),
+        square_off_positions_for_account(alice, account_name)
+    )
+
+# (stop loss sign, target sign, stop loss side, target side) per main order side
+_SL_TL_TABLE = {
+    'B': (-1.0, +1.0, TransactionType.Sell, TransactionType.Sell),  # Buy order
+    'S': (+1.0, -1.0, TransactionType.Buy, TransactionType.Buy)     # Sell order
+}
+
 # Helper function to place stop loss order
 def place_sl_tl_orders(alice_instance, instrument, main_order_result, transaction_type, quantity, account_name, settings, data):
     """Place both stop loss and target orders after main order execution"""
@@ -533,17 +750,11 @@ def place_sl_tl_orders(alice_instance, instrument, main_order_result, transactio
                 'main_order_id': main_order_result.get('NOrdNo')
             }
 
-        # Calculate stop loss and target prices
-        if transaction_type == 'B':  # Buy order
-            stop_loss_price = main_price * (1 - stop_loss_margin / 100)
-            target_price = main_price * (1 + target_margin / 100)
-            sl_transaction_type = TransactionType.Sell
-            target_transaction_type = TransactionType.Sell
-        else:  # Sell order
-            stop_loss_price = (main_price * (1 + stop_loss_margin / 100))
-            target_price = main_price * (1 - target_margin / 100)
-            sl_transaction_type = TransactionType.Buy
-            target_transaction_type = TransactionType.Buy
+        # Calculate stop loss and target prices (anything other than 'B' is a sell)
+        sl_sign, tgt_sign, sl_transaction_type, target_transaction_type = \
+            _SL_TL_TABLE.get(transaction_type, _SL_TL_TABLE['S'])
+        stop_loss_price = main_price * (1 + sl_sign * stop_loss_margin / 100)
+        target_price = main_price * (1 + tgt_sign * target_margin / 100)
 
         # --- Place Stop Loss Order ---
         stop_loss_result = alice_instance.place_order(
@@ -597,7 +808,7 @@ def place_sl_tl_orders(alice_instance, instrument, main_order_result, transactio
 @app.route('/api/place-order-primary', methods=['POST'])
 def place_order_primary():
     """Place order on primary account only"""
-    data = request.get_json() or {}
+    data = _json_body()
 
     # --- Load settings ---
     settings = json.load(open('appsettings.json'))['Settings']
@@ -658,7 +869,7 @@ def place_order_primary():
 def place_order_all():
     """Optimized: Place order on all connected accounts"""
     try:
-        data = request.get_json() or {}
+        data = _json_body()
         exchange = data['exchange']
         symbol = data['trading_symbol']
         quantity = int(data['quantity'])
@@ -690,9 +901,9 @@ def place_order_all():
             try:
                 sess = ab.get_session_id()
                 if sess.get('stat') != 'Ok':
-                    return {'account_name': name, 'success': False, 'error': 'Session failed'}
+                    return OrderResult(account_name=name, success=False, error='Session failed')
             except Exception as e:
-                return {'account_name': name, 'success': False, 'error': f'Session error: {e}'}
+                return OrderResult(account_name=name, success=False, error=f'Session error: {e}')
 
             # Place the main order
             result = ab.place_order(
@@ -708,12 +919,12 @@ def place_order_all():
             # Process result
             # -------------------
             if result and result.get('stat') == 'Ok':
-                response = {
-                    'success': True,
-                    'order_id': result.get('NOrdNo'),
-                    'account_name': name,
-                    'message': f'Order placed successfully on {name}'
-                }
+                response = OrderResult(
+                    account_name=name,
+                    success=True,
+                    order_id=result.get('NOrdNo'),
+                    message=f'Order placed successfully on {name}'
+                )
 
                 # Optional stop loss & target logic
                 if is_market:
@@ -723,51 +934,50 @@ def place_order_all():
                             name, GLOBAL_SETTINGS, data
                         )
                         if 'error' in sl_tl_result:
-                            response['stop_loss_error'] = sl_tl_result['error']
+                            response.stop_loss_error = sl_tl_result['error']
                         else:
-                            response['stop_loss_orders'] = sl_tl_result
-                            response['message'] += ' with Stop Loss & Target orders'
+                            response.stop_loss_orders = sl_tl_result
+                            response.message += ' with Stop Loss & Target orders'
                     except Exception as e:
-                        response['stop_loss_error'] = str(e)
+                        response.stop_loss_error = str(e)
 
                 return response
             else:
-                return {
-                    'account_name': name,
-                    'success': False,
-                    'error': result.get('emsg', 'Order failed')
-                }
+                return OrderResult(
+                    account_name=name,
+                    success=False,
+                    error=result.get('emsg', 'Order failed')
+                )
 
         except Exception as e:
-            return {'account_name': name, 'success': False, 'error': str(e)}
+            return OrderResult(account_name=name, success=False, error=str(e))
 
     # -------------------------------
     # Execute orders in parallel
     # -------------------------------
-    from concurrent.futures import ThreadPoolExecutor, as_completed
     successful_orders, failed_orders = [], []
     with ThreadPoolExecutor(max_workers=min(8, len(GLOBAL_ACCOUNTS))) as executor:
         futures = {executor.submit(place_order, acc): acc for acc in GLOBAL_ACCOUNTS}
         for future in as_completed(futures):
             result = future.result()
-            (successful_orders if result.get('success', False) else failed_orders).append(result)
+            (successful_orders if result.success else failed_orders).append(result)
 
     # -------------------------------
     # Final API response
     # -------------------------------
     if successful_orders:
-        return jsonify({
+        return Response(msgspec.json.encode({
             'success': True,
             'message': f"Orders placed on {len(successful_orders)}/{len(GLOBAL_ACCOUNTS)} account(s)",
             'successful_orders': successful_orders,
             'failed_orders': failed_orders
-        })
+        }), mimetype='application/json')
     else:
-        return jsonify({
+        return Response(msgspec.json.encode({
             'success': False,
             'error': 'All orders failed',
             'failed_orders': failed_orders
-        }), 400
+        }), status=400, mimetype='application/json')
 
 @app.route('/api/cancel-order', methods=['POST'])
 def cancel_order():
@@ -777,7 +987,7 @@ def cancel_order():
         return error_response
     
     try:
-        data = request.get_json()
+        data = _json_body()
         if not data:
             return jsonify({
                 'error': 'Invalid request data',
@@ -812,11 +1022,36 @@ def cancel_order():
 
 
 
+# Decrypted credentials keyed by (digest of encrypted accounts, settings mtime)
+_decrypted_accounts_cache = {}
+_decrypted_accounts_lock = threading.Lock()
+DECRYPTED_ACCOUNTS_TTL = 60  # seconds
+
+def get_decrypted_accounts(accounts):
+    """Decrypt account credentials, reusing a recent result for the same settings"""
+    key = (hashlib.blake2b(orjson.dumps(accounts, option=orjson.OPT_SORT_KEYS), digest_size=16).digest(),
+           os.stat('appsettings.json').st_mtime)
+    now = time.monotonic()
+    
+    with _decrypted_accounts_lock:
+        cached = _decrypted_accounts_cache.get(key)
+        if cached and now - cached[0] < DECRYPTED_ACCOUNTS_TTL:
+            return cached[1]
+    
+    decrypted = decrypt_alice_blue_accounts(accounts)
+    
+    with _decrypted_accounts_lock:
+        # Only the current settings are worth keeping
+        _decrypted_accounts_cache.clear()
+        _decrypted_accounts_cache[key] = (now, decrypted)
+    
+    return decrypted
+
 @app.route('/api/comprehensive-square-off', methods=['POST'])
 def comprehensive_square_off():
     """Comprehensive square off: Cancel orders -> Square off positions"""
     try:
-        data = request.get_json() or {}
+        data = _json_body()
         account_mode = data.get('account_mode', 'primary')
         
         # Load accounts
@@ -829,8 +1064,7 @@ def comprehensive_square_off():
                 is_encrypted_settings = settings_data.get('IsEncrypted', False)
                 if is_encrypted_settings and ENCRYPTION_AVAILABLE and accounts:
                     try:
-                        accounts = decrypt_alice_blue_accounts(accounts)
-                        print("Decrypted AliceBlue account credentials for comprehensive square off")
+                        accounts = get_decrypted_accounts(accounts)
                     except Exception as e:
                         print(f"Error decrypting credentials for comprehensive square off: {e}")
                         return jsonify({'success': False, 'error': 'Failed to decrypt account credentials'}), 500
@@ -850,76 +1084,58 @@ def comprehensive_square_off():
             'step2_auto_square_off': {'success': False, 'message': '', 'details': []}
         }
 
-        # STEP 1: Cancel orders
         if account_mode == 'primary':
-            cancel_result = cancel_orders_for_account(alice, 'Primary Account')
+            # Broker calls run on the worker pool so the request thread only waits on the result
+            cancel_result, square_off_result = ACCOUNT_WORKER_POOL.submit(
+                cancel_and_square_off_account, alice, 'Primary Account'
+            ).result()
+            
+            # STEP 1: Cancel orders
             results['step1_cancel_orders'] = {
                 'success': cancel_result['success'],
                 'message': cancel_result['message'],
                 'details': cancel_result['successful_cancellations'] + cancel_result['failed_cancellations']
             }
-        else:
-            # Process all accounts in parallel
-            import concurrent.futures
-            
-            def process_account_cancel(account):
-                try:
-                    account_alice = Aliceblue(user_id=account.get('UserId'), api_key=account.get('ApiKey'))
-                    if account_alice.get_session_id().get('stat') == 'Ok':
-                        return cancel_orders_for_account(account_alice, account.get('Name', 'Unknown'))
-                    else:
-                        return {'success': False, 'message': 'Session failed', 'successful_cancellations': [], 'failed_cancellations': []}
-                except Exception as e:
-                    return {'success': False, 'message': str(e), 'successful_cancellations': [], 'failed_cancellations': []}
             
-            successful_cancellations = []
-            failed_cancellations = []
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [executor.submit(process_account_cancel, account) for account in accounts_to_use]
-                
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    successful_cancellations.extend(result['successful_cancellations'])
-                    failed_cancellations.extend(result['failed_cancellations'])
-            
-            results['step1_cancel_orders'] = {
-                'success': len(successful_cancellations) > 0 or len(failed_cancellations) == 0,
-                'message': f'Cancelled {len(successful_cancellations)} order(s)' if successful_cancellations else 'No orders to cancel',
-                'details': successful_cancellations + failed_cancellations
-            }
-        
-        # STEP 2: Square off positions
-        if account_mode == 'primary':
-            square_off_result = square_off_positions_for_account(alice, 'Primary Account')
+            # STEP 2: Square off positions
             results['step2_auto_square_off'] = {
                 'success': square_off_result['success'],
                 'message': square_off_result['message'],
                 'details': square_off_result['successful_square_offs'] + square_off_result['failed_square_offs']
             }
         else:
-            # Process all accounts in parallel
-            def process_account_square_off(account):
+            # Process all accounts in parallel; each account still cancels before squaring off
+            def process_account(account):
                 try:
-                    account_alice = Aliceblue(user_id=account.get('UserId'), api_key=account.get('ApiKey'))
-                    if account_alice.get_session_id().get('stat') == 'Ok':
-                        return square_off_positions_for_account(account_alice, account.get('Name', 'Unknown'))
-                    else:
-                        return {'success': False, 'message': 'Session failed', 'successful_square_offs': [], 'failed_square_offs': []}
+                    account_alice = get_alice_client(account.get('UserId'), account.get('ApiKey'))
+                    if not account_alice:
+                        return (
+                            {'success': False, 'message': 'Session failed', 'successful_cancellations': [], 'failed_cancellations': []},
+                            {'success': False, 'message': 'Session failed', 'successful_square_offs': [], 'failed_square_offs': []}
+                        )
+                    return cancel_and_square_off_account(account_alice, account.get('Name', 'Unknown'))
                 except Exception as e:
-                    return {'success': False, 'message': str(e), 'successful_square_offs': [], 'failed_square_offs': []}
+                    return (
+                        {'success': False, 'message': str(e), 'successful_cancellations': [], 'failed_cancellations': []},
+                        {'success': False, 'message': str(e), 'successful_square_offs': [], 'failed_square_offs': []}
+                    )
             
+            successful_cancellations = []
+            failed_cancellations = []
             successful_square_offs = []
             failed_square_offs = []
             
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [executor.submit(process_account_square_off, account) for account in accounts_to_use]
-                
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    successful_square_offs.extend(result['successful_square_offs'])
-                    failed_square_offs.extend(result['failed_square_offs'])
+            for cancel_result, square_off_result in ACCOUNT_WORKER_POOL.map(process_account, accounts_to_use):
+                successful_cancellations.extend(cancel_result['successful_cancellations'])
+                failed_cancellations.extend(cancel_result['failed_cancellations'])
+                successful_square_offs.extend(square_off_result['successful_square_offs'])
+                failed_square_offs.extend(square_off_result['failed_square_offs'])
             
+            results['step1_cancel_orders'] = {
+                'success': len(successful_cancellations) > 0 or len(failed_cancellations) == 0,
+                'message': f'Cancelled {len(successful_cancellations)} order(s)' if successful_cancellations else 'No orders to cancel',
+                'details': successful_cancellations + failed_cancellations
+            }
             results['step2_auto_square_off'] = {
                 'success': len(successful_square_offs) > 0,
                 'message': f'Squared off {len(successful_square_offs)} position(s)' if successful_square_offs else 'No positions to square off',
@@ -967,22 +1183,18 @@ def get_trade_book():
 def handle_connect():
     """Handle client connection"""
     try:
-        clients_connected.add(request.sid)
+        join_room(legacy_market_data_room)
+        ts_ms = int(time.time() * 1000)
         
         emit('connected', {
             'message': 'Connected to real-time data stream',
-            'timestamp': int(time.time() * 1000),
-            'server_time': datetime.now().isoformat()
+            'timestamp': ts_ms,
+            'server_time_ms': ts_ms
         })
         
         # Send initial market data if available
-        if previous_market_data['nifty50']['price'] > 0:
-            initial_data = {
-                'type': 'market_data',
-                'data': previous_market_data,
-                'timestamp': int(time.time() * 1000)
-            }
-            emit('market_data_update', initial_data)
+        if market_snap.nifty50_price > 0:
+            emit('market_data_update', _market_snapshot_cache)
             
     except Exception as e:
         emit('error', {
@@ -994,56 +1206,28 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    try:
-        clients_connected.discard(request.sid)
-    except Exception as e:
-        pass
+    # Room membership is cleaned up by Socket.IO
+    pass
 
 @socketio.on('ping')
 def handle_ping():
     """Handle ping from client"""
-    try:
-        emit('pong', {'timestamp': int(time.time() * 1000)})
-    except Exception as e:
-        pass
+    emit('pong', {'timestamp': int(time.time() * 1000)})
 
 @socketio.on('pong')
 def handle_pong():
     """Handle pong from client"""
-    try:
-        # Client is alive, no action needed
-        pass
-    except Exception as e:
-        pass
+    # Client is alive, no action needed
+    pass
 
 @socketio.on('subscribe_market_data')
 def handle_subscribe_market_data():
     """Handle market data subscription"""
     try:
-        emit('subscribed', {
-            'type': 'market_data', 
-            'message': 'Subscribed to market data updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('subscribed', {**_SUBSCRIBED_MD_TMPL, 'timestamp': int(time.time() * 1000)})
     
     # Send current market data immediately
-        current_data = {
-            'type': 'market_data',
-            'data': {
-                'nifty50': {
-                    'price': previous_market_data['nifty50']['price'],
-                    'change': previous_market_data['nifty50']['change'],
-                    'changePercent': previous_market_data['nifty50']['changePercent']
-                },
-                'niftyBank': {
-                    'price': previous_market_data['niftyBank']['price'],
-                    'change': previous_market_data['niftyBank']['change'],
-                    'changePercent': previous_market_data['niftyBank']['changePercent']
-                }
-            },
-            'timestamp': int(time.time() * 1000)
-        }
-        emit('market_data_update', current_data)
+        emit('market_data_update', _market_snapshot_cache)
     except Exception as e:
         emit('error', {
             'type': 'subscription_error',
@@ -1055,11 +1239,7 @@ def handle_subscribe_market_data():
 def handle_unsubscribe_market_data():
     """Handle market data unsubscription"""
     try:
-        emit('unsubscribed', {
-            'type': 'market_data',
-            'message': 'Unsubscribed from market data updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('unsubscribed', {**_UNSUBSCRIBED_MD_TMPL, 'timestamp': int(time.time() * 1000)})
     except Exception as e:
         pass
 
@@ -1067,23 +1247,12 @@ def handle_unsubscribe_market_data():
 def handle_subscribe_contracts():
     """Handle contract data subscription"""
     try:
-        emit('subscribed', {
-            'type': 'contracts', 
-            'message': 'Subscribed to contract updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('subscribed', {**_SUBSCRIBED_CONTRACTS_TMPL, 'timestamp': int(time.time() * 1000)})
         
         # Send current contract data immediately if available
         try:
-            if contract_data:
-                contract_updates = {}
-                for token, data in contract_data.items():
-                    if data['price'] > 0:  # Only send contracts with valid prices
-                        contract_updates[token] = {
-                            'price': data['price'],
-                            'change': data['change'],
-                            'changePercent': data['changePercent']
-                        }
+            if contract_slot_tokens:
+                contract_updates = build_contract_updates()
                 
                 if contract_updates:
                     update_data = {
@@ -1106,11 +1275,7 @@ def handle_subscribe_contracts():
 def handle_unsubscribe_contracts():
     """Handle contract data unsubscription"""
     try:
-        emit('unsubscribed', {
-            'type': 'contracts',
-            'message': 'Unsubscribed from contract updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('unsubscribed', {**_UNSUBSCRIBED_CONTRACTS_TMPL, 'timestamp': int(time.time() * 1000)})
     except Exception as e:
         pass
 
@@ -1122,48 +1287,27 @@ def handle_unsubscribe_contracts():
 @socketio.on('connect', namespace=market_data_namespace)
 def handle_market_data_connect():
     """Handle market data WebSocket connection"""
-    clients_connected.add(request.sid)
-    emit('connected', {'message': 'Connected to market data stream'})
+    join_room(market_data_room)
+    emit('connected', _CONNECTED_MD_MSG)
 
 @socketio.on('disconnect', namespace=market_data_namespace)
 def handle_market_data_disconnect():
     """Handle market data WebSocket disconnection"""
-    clients_connected.discard(request.sid)
+    leave_room(market_data_room)
 
 @socketio.on('ping', namespace=market_data_namespace)
 def handle_market_data_ping():
     """Handle ping from client"""
-    try:
-        emit('pong', {'timestamp': int(time.time() * 1000)})
-    except Exception as e:
-        pass
+    emit('pong', {'timestamp': int(time.time() * 1000)})
 
 @socketio.on('subscribe_market_data', namespace=market_data_namespace)
 def handle_market_data_subscription():
     """Handle market data subscription"""
     try:
-        emit('subscribed', {
-            'type': 'market_data',
-            'message': 'Subscribed to market data updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('subscribed', {**_SUBSCRIBED_MD_TMPL, 'timestamp': int(time.time() * 1000)})
         
         # Send current market data immediately
-        current_data = {
-            'type': 'market_data',
-            'data': {
-                'nifty50': {
-                    'price': previous_market_data['nifty50']['price'],
-                    'changePercent': previous_market_data['nifty50']['changePercent']
-                },
-                'niftyBank': {
-                    'price': previous_market_data['niftyBank']['price'],
-                    'changePercent': previous_market_data['niftyBank']['changePercent']
-                }
-            },
-            'timestamp': int(time.time() * 1000)
-        }
-        emit('market_data_update', current_data)
+        emit('market_data_update', _market_snapshot_cache)
         
     except Exception as e:
         emit('error', {
@@ -1179,41 +1323,28 @@ def handle_market_data_subscription():
 @socketio.on('connect', namespace=contracts_namespace)
 def handle_contracts_connect():
     """Handle contracts WebSocket connection"""
-    clients_connected.add(request.sid)
-    emit('connected', {'message': 'Connected to contracts stream'})
+    emit('connected', _CONNECTED_CONTRACTS_MSG)
 
 @socketio.on('disconnect', namespace=contracts_namespace)
 def handle_contracts_disconnect():
     """Handle contracts WebSocket disconnection"""
-    clients_connected.discard(request.sid)
+    # Room membership is cleaned up by Socket.IO
+    pass
 
 @socketio.on('ping', namespace=contracts_namespace)
 def handle_contracts_ping():
     """Handle ping from client"""
-    try:
-        emit('pong', {'timestamp': int(time.time() * 1000)})
-    except Exception as e:
-        pass
+    emit('pong', {'timestamp': int(time.time() * 1000)})
 
 @socketio.on('subscribe_contracts', namespace=contracts_namespace)
 def handle_contracts_subscription():
     """Handle contracts subscription"""
     try:
-        emit('subscribed', {
-            'type': 'contracts',
-            'message': 'Subscribed to contract updates',
-            'timestamp': int(time.time() * 1000)
-        })
+        emit('subscribed', {**_SUBSCRIBED_CONTRACTS_TMPL, 'timestamp': int(time.time() * 1000)})
         
         # Send current contract data immediately if available
-        if contract_data:
-            contract_updates = {}
-            for token, data in contract_data.items():
-                if data['price'] > 0:  # Only send contracts with valid prices
-                    contract_updates[token] = {
-                        'price': data['price'],
-                        'changePercent': data['changePercent']
-                    }
+        if contract_slot_tokens:
+            contract_updates = build_contract_updates()
             
             if contract_updates:
                 update_data = {
@@ -1317,6 +1448,8 @@ def load_app_settings():
 
 def reload_app_settings():
     """Reload app settings from file"""
+    with _decrypted_accounts_lock:
+        _decrypted_accounts_cache.clear()
     return load_app_settings()
 
 @app.route('/api/reload-settings', methods=['POST'])
@@ -1333,7 +1466,7 @@ def reload_settings():
 
 def initialize_market_data():
     """Initialize market data with current values"""
-    global previous_market_data
+    global market_snap
     
     if not ALICE_BLUE_AVAILABLE or not is_connected:
         return
@@ -1347,20 +1480,41 @@ def initialize_market_data():
         niftyBank_data = alice.get_scrip_info(niftyBank_instrument)
         
         # Set initial values
-        previous_market_data['nifty50']['price'] = float(nifty50_data.get('LTP', 0))
-        previous_market_data['nifty50']['changePercent'] = float(nifty50_data.get('pc', 0))
+        market_snap = MarketSnap(
+            nifty50_price=float(nifty50_data.get('LTP', 0)),
+            nifty50_pct=float(nifty50_data.get('pc', 0)),
+            bank_price=float(niftyBank_data.get('LTP', 0)),
+            bank_pct=float(niftyBank_data.get('pc', 0))
+        )
         
-        previous_market_data['niftyBank']['price'] = float(niftyBank_data.get('LTP', 0))
-        previous_market_data['niftyBank']['changePercent'] = float(niftyBank_data.get('pc', 0))
+        refresh_market_snapshot()
         
         print("Initialized market data with current values")
         
     except Exception as e:
         pass
 
+def load_nfo_instruments():
+    """Build the NFO token -> Instrument map from the master contract file (once per session)"""
+    global nfo_instrument_by_token
+    
+    if nfo_instrument_by_token is None:
+        if not os.path.exists('NFO.csv'):
+            alice.get_contract_master('NFO')
+        
+        # Same fields pya3's get_instrument_by_token fills in, without a pandas scan per token
+        with open('NFO.csv', newline='') as f:
+            nfo_instrument_by_token = {
+                int(row['Token']): Instrument(row['Exch'], int(row['Token']), row['Symbol'],
+                                              row['Trading Symbol'], '', int(row['Lot Size']))
+                for row in csv.DictReader(f)
+            }
+    
+    return nfo_instrument_by_token
+
 def subscribe_to_contracts(contract_tokens):
     """Subscribe to contract tokens for real-time updates"""
-    global subscribed_contract_tokens, contract_data
+    global subscribed_contract_tokens
     
     if not ALICE_BLUE_AVAILABLE or not is_connected:
         return False
@@ -1373,24 +1527,24 @@ def subscribe_to_contracts(contract_tokens):
         instruments = []
         valid_tokens = []
         
+        nfo_instruments = load_nfo_instruments()
+        
         for token in contract_tokens:
             try:
-                # Try to get instrument by token (assuming NFO exchange)
-                instrument = alice.get_instrument_by_token('NFO', int(token))
-                instruments.append(instrument)
-                valid_tokens.append(token)
-                subscribed_contract_tokens.add(token)
-                
-                # Initialize contract data
-                if token not in contract_data:
-                    contract_data[token] = {
-                        'price': 0,
-                        'changePercent': 0,
-                        'previousPrice': 0
-                    }
-                    
-            except Exception as e:
+                # Look up the instrument by token (assuming NFO exchange)
+                instrument = nfo_instruments.get(int(token))
+            except (ValueError, TypeError):
                 continue
+            
+            if instrument is None:
+                continue
+            
+            instruments.append(instrument)
+            valid_tokens.append(token)
+            subscribed_contract_tokens.add(token)
+            
+            # Initialize contract data
+            contract_slot(token)
         
         if instruments:
             # Subscribe to instruments
@@ -1406,41 +1560,72 @@ def subscribe_to_contracts(contract_tokens):
     except Exception as e:
         return False
 
+def _update_nifty50(ltp, pc):
+    """Publish a new market snapshot with the latest NIFTY 50 tick"""
+    global market_snap
+    market_snap = market_snap._replace(nifty50_price=ltp, nifty50_pct=pc)
+
+def _update_nifty_bank(ltp, pc):
+    """Publish a new market snapshot with the latest NIFTY BANK tick"""
+    global market_snap
+    market_snap = market_snap._replace(bank_price=ltp, bank_pct=pc)
+
+# Index tick dispatch: token -> handler
+TICK_HANDLERS = {
+    '26000': _update_nifty50,     # NIFTY 50
+    '26009': _update_nifty_bank   # NIFTY BANK
+}
+
+def contract_slot(token):
+    """Return the array slot for a contract token, allocating one on first use"""
+    idx = contract_index.get(token)
+    if idx is None:
+        with _contract_slot_lock:
+            idx = contract_index.get(token)
+            if idx is None:
+                # Grow the arrays before publishing the token so readers never index past them
+                contract_prices.append(0.0)
+                contract_change_percents.append(0.0)
+                contract_previous_prices.append(0.0)
+                contract_slot_tokens.append(token)
+                idx = contract_index[token] = len(contract_slot_tokens) - 1
+    return idx
+
+def build_contract_updates(tokens=None):
+    """Collect {token: {price, changePercent}} for contracts with a valid price"""
+    prices = contract_prices
+    change_percents = contract_change_percents
+    
+    if tokens is None:
+        slots = range(len(contract_slot_tokens))
+    else:
+        slots = (contract_index[token] for token in tokens if token in contract_index)
+    
+    return {
+        contract_slot_tokens[idx]: {'price': prices[idx], 'changePercent': change_percents[idx]}
+        for idx in slots
+        if prices[idx] > 0  # Only send contracts with valid prices
+    }
+
 def update_contract_data(token, ltp, pc):
     """Update contract data with real-time price information"""
-    global contract_data
-    
-    if token not in contract_data:
-        contract_data[token] = {
-            'price': 0,
-            'changePercent': 0,
-            'previousPrice': 0
-        }
+    idx = contract_slot(token)
     
     # Store previous price for change calculation
-    previous_price = contract_data[token]['price']
+    contract_previous_prices[idx] = contract_prices[idx]
     
     # Update contract data
-    contract_data[token]['price'] = ltp
-    contract_data[token]['changePercent'] = pc
-    contract_data[token]['previousPrice'] = previous_price
+    contract_prices[idx] = ltp
+    contract_change_percents[idx] = pc
 
-def broadcast_contract_updates():
-    """Broadcast contract updates to all connected clients"""
-    global contract_data, clients_connected
-    
-    if not clients_connected or not contract_data:
+def broadcast_contract_updates(tokens=None):
+    """Broadcast contract updates (all contracts, or only the given tokens) to all connected clients"""
+    if not contract_slot_tokens or not room_has_clients(contracts_namespace):
         return
     
     try:
         # Prepare contract updates
-        contract_updates = {}
-        for token, data in contract_data.items():
-            if data['price'] > 0:  # Only send contracts with valid prices
-                contract_updates[token] = {
-                    'price': data['price'],
-                    'changePercent': data['changePercent']
-                }
+        contract_updates = build_contract_updates(tokens)
         
         if contract_updates:
             update_data = {
@@ -1455,14 +1640,55 @@ def broadcast_contract_updates():
     except Exception as e:
         pass
 
+def broadcast_market_data():
+    """Refresh the market snapshot and broadcast it to market data subscribers"""
+    market_data = refresh_market_snapshot()
+    
+    try:
+        if room_has_clients(market_data_namespace, market_data_room):
+            # Broadcast once to the market data room
+            socketio.emit('market_data_update', market_data, room=market_data_room, namespace=market_data_namespace)
+        
+        if room_has_clients('/', legacy_market_data_room):
+            # Also broadcast to legacy default namespace clients for backward compatibility
+            socketio.emit('market_data_update', market_data, room=legacy_market_data_room)
+    except Exception as e:
+        pass
+
+def tick_emitter_loop():
+    """Drain queued ticks every TICK_EMIT_INTERVAL and broadcast what changed"""
+    while True:
+        socketio.sleep(TICK_EMIT_INTERVAL)
+        if not _tick_q:
+            continue
+        
+        tokens = set()
+        try:
+            while True:
+                tokens.add(_tick_q.popleft())
+        except IndexError:
+            pass
+        
+        if not tokens.isdisjoint(TICK_HANDLERS):
+            broadcast_market_data()
+            tokens.difference_update(TICK_HANDLERS)
+        
+        if tokens:
+            broadcast_contract_updates(tokens)
+
 def start_aliceblue_websocket():
     """Start AliceBlue websocket for real-time data"""
-    global websocket_running
+    global websocket_running, tick_emitter_running
     
     if not ALICE_BLUE_AVAILABLE or not is_connected or websocket_running:
         return
     
     try:
+        # Start the tick broadcaster once
+        if not tick_emitter_running:
+            tick_emitter_running = True
+            socketio.start_background_task(tick_emitter_loop)
+        
         # Initialize market data first
         initialize_market_data()
         
@@ -1484,69 +1710,56 @@ def start_aliceblue_websocket():
             global websocket_running
             websocket_running = False
         
+        # Bind hot-path globals as closure variables so each tick avoids global lookups
+        # (none of these objects are ever rebound; the token set is only mutated in place)
+        loads = orjson.loads
+        decode_error = orjson.JSONDecodeError
+        tick_handlers = TICK_HANDLERS
+        subscribed_tokens = subscribed_contract_tokens
+        update_contract = update_contract_data
+        enqueue_tick = _tick_q.append
+        
         def subscription_callback(message):
             try:
-                data = json.loads(message)
+                data = loads(message)
+            except decode_error:
+                return
+
+            if not isinstance(data, dict):
+                return
+
+            feed_type = data.get('t')
+
+            if feed_type == "ck":
+                return
 
-                if data.get("t") == "ck":
+            # Tick feed (real-time updates)
+            if feed_type not in ('tk', 'tf') or 'lp' not in data or 'tk' not in data:
+                return
+
+            token = str(data['tk'])
+            try:
+                ltp = float(data['lp'])
+                pc = float(data['pc'])
+                if ltp <= 0:
                     return
+            except (KeyError, ValueError, TypeError):
+                return
 
-                # Tick feed (real-time updates)
-                if 'lp' in data and 'tk' in data and data.get('t') in ['tk', 'tf']:
-                    token = str(data['tk'])
-                    try:
-                        ltp = float(data['lp'])
-                        pc = float(data['pc'])
-                        if ltp <= 0:
-                            return
-                    except (ValueError, TypeError) as e:
-                        return
-
-                    updated = False
-
-                    if token == '26000':  # NIFTY 50
-                        previous_market_data['nifty50']['price'] = ltp
-                        previous_market_data['nifty50']['changePercent'] = pc
-                        updated = True
-
-                    elif token == '26009':  # NIFTY BANK
-                        previous_market_data['niftyBank']['price'] = ltp
-                        previous_market_data['niftyBank']['changePercent'] = pc
-                        updated = True
-
-                    # Check if this is a contract token
-                    elif token in subscribed_contract_tokens:
-                        update_contract_data(token, ltp, pc)
-                        # Broadcast contract updates
-                        broadcast_contract_updates()
-
-                    # Broadcast only if updated
-                    if updated and clients_connected:
-                        market_data = {
-                            'type': 'market_data',
-                            'data': {
-                                'nifty50': {
-                                    'price': previous_market_data['nifty50']['price'],
-                                    'changePercent': previous_market_data['nifty50']['changePercent']
-                                },
-                                'niftyBank': {
-                                    'price': previous_market_data['niftyBank']['price'],
-                                    'changePercent': previous_market_data['niftyBank']['changePercent']
-                                }
-                            },
-                            'timestamp': int(time.time() * 1000)
-                        }
-
-                        # Broadcast to all connected clients
-                        socketio.emit('market_data_update', market_data, namespace=market_data_namespace)
-                        
-                        # Also broadcast to main namespace for backward compatibility
-                        socketio.emit('market_data_update', market_data)
-                else:
-                    pass
-                
-            except Exception as e:
-                pass
+            handler = tick_handlers.get(token)
+
+            if handler is not None:  # NIFTY 50 / NIFTY BANK
+                handler(ltp, pc)
+
+            # Check if this is a contract token
+            elif token in subscribed_tokens:
+                update_contract(token, ltp, pc)
+
+            else:
+                return
+
+            # Broadcasting happens in tick_emitter_loop
+            enqueue_tick(token)
         
         # Start the websocket
         alice.start_websocket(
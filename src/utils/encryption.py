@@ -4,113 +4,220 @@ Compatible with the JavaScript encryption utilities
 """
 
 import base64
-import json
-from Cryptodome.Cipher import AES
-from Cryptodome.Util.Padding import pad, unpad
+import os
+import re
 import hashlib
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# AES backend, chosen once at import: cryptography (OpenSSL EVP) if installed, else
+# pycryptodomex. Both pick AES-NI themselves at load time, so the hot path never branches
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    
+    @functools.lru_cache(maxsize=512)
+    def _cipher_for(key, iv):
+        """Returns the AES-CBC Cipher for a key/IV (memoized; Cipher is stateless, decryptor() is not)"""
+        return Cipher(algorithms.AES(key), modes.CBC(iv))
+    
+    def _encrypt_cbc(key, iv, data):
+        """AES-CBC encrypts block-aligned data"""
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+    
+    def _decrypt_cbc(cipher, data):
+        """AES-CBC decrypts block-aligned data with a prepared cipher"""
+        decryptor = cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+except ImportError:
+    from Cryptodome.Cipher import AES
+    
+    def _cipher_for(key, iv):
+        """Returns the key/IV pair (PyCryptodome CBC objects are stateful, so one is built per call)"""
+        return key, iv
+    
+    def _encrypt_cbc(key, iv, data):
+        """AES-CBC encrypts block-aligned data"""
+        return AES.new(key, AES.MODE_CBC, iv).encrypt(data)
+    
+    def _decrypt_cbc(cipher, data):
+        """AES-CBC decrypts block-aligned data with a prepared key/IV pair"""
+        key, iv = cipher
+        return AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+# SIMD base64 has a fixed setup cost and only beats the stdlib above roughly 250 bytes
+# (decode) and 1000 bytes (encode); short credentials stay on the scalar stdlib path
+_B64_SIMD_DECODE_THRESHOLD = 256
+_B64_SIMD_ENCODE_THRESHOLD = 1024
+
+def _b64decode(text):
+    """Base64-decodes text, using pybase64 for long inputs"""
+    if pybase64 is not None and len(text) > _B64_SIMD_DECODE_THRESHOLD:
+        return pybase64.b64decode(text)
+    return base64.b64decode(text)
+
+def _b64encode_str(data):
+    """Base64-encodes bytes to str, using pybase64 for long inputs"""
+    if pybase64 is not None and len(data) > _B64_SIMD_ENCODE_THRESHOLD:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
+# AES block size in bytes (used for the IV and PKCS7 padding)
+AES_BLOCK_SIZE = 16
+
+# Base64 alphabet, more than 20 characters long (what is_encrypted treats as ciphertext)
+_B64_RE = re.compile(r'[A-Za-z0-9+/=]{21,}')
 
 # Salt for encryption - same as in the JavaScript utility file
 ENCRYPTION_SALT = 'aliceblue-trading-salt-2024'
+_ENCRYPTION_SALT_BYTES = ENCRYPTION_SALT.encode('ascii')
+
+# Key for the simple (non crypto-js) format, derived once from the constant salt
+_CACHED_KEY = hashlib.sha256(_ENCRYPTION_SALT_BYTES).digest()
 
 def encrypt_text(text):
     """Encrypts a string using AES encryption with a salt (compatible with crypto-js)"""
     if not text:
         return text
     
-    try:
-        # Create a key from the salt (simple approach like crypto-js)
-        key = hashlib.sha256(ENCRYPTION_SALT.encode()).digest()
-        
-        # Create cipher
-        cipher = AES.new(key, AES.MODE_CBC)
-        
-        # Pad the text using PKCS7 padding
-        padded_text = pad(text.encode('utf-8'), AES.block_size)
-        
-        # Encrypt
-        encrypted = cipher.encrypt(padded_text)
-        
-        # Combine IV and encrypted data
-        encrypted_data = cipher.iv + encrypted
-        
-        # Encode to base64
-        encrypted_text = base64.b64encode(encrypted_data).decode('utf-8')
+    # Key derived from the salt (simple approach like crypto-js)
+    key = _CACHED_KEY
+    
+    iv = os.urandom(AES_BLOCK_SIZE)
+    
+    # Pad the text using PKCS7 padding
+    text_bytes = text.encode('utf-8')
+    pad_len = AES_BLOCK_SIZE - (len(text_bytes) % AES_BLOCK_SIZE)
+    padded_text = text_bytes + bytes((pad_len,)) * pad_len
+    
+    # Encrypt
+    encrypted = _encrypt_cbc(key, iv, padded_text)
+    
+    # Combine IV and encrypted data in one preallocated buffer
+    encrypted_data = bytearray(AES_BLOCK_SIZE + len(encrypted))
+    encrypted_data[:AES_BLOCK_SIZE] = iv
+    encrypted_data[AES_BLOCK_SIZE:] = encrypted
+    
+    # Encode to base64
+    encrypted_text = _b64encode_str(encrypted_data)
+    
+    return encrypted_text
+
+def _split_payload(encrypted_data):
+    """Splits decoded ciphertext into (key, iv, encrypted) for either supported format"""
+    # Slice through a view so the ciphertext is not copied; salt and IV stay bytes because
+    # they are cache and grouping keys
+    view = memoryview(encrypted_data)
+    
+    # Check for "Salted__" prefix (crypto-js format)
+    if encrypted_data.startswith(b'Salted__'):
+        # Extract salt and encrypted data
+        salt = bytes(view[8:16])  # 8 bytes after "Salted__"
+        encrypted = view[16:]  # Rest is encrypted data
         
-        return encrypted_text
-    except Exception as e:
-        print(f"Encryption error: {e}")
-        return text
+        # Create key and IV using EVP_BytesToKey (OpenSSL compatible)
+        key, iv = _evp_bytes_to_key_32_16(_ENCRYPTION_SALT_BYTES, salt)
+    else:
+        # Fallback to simple approach
+        key = _CACHED_KEY
+        iv = bytes(view[:AES_BLOCK_SIZE])
+        encrypted = view[AES_BLOCK_SIZE:]
+    
+    return key, iv, encrypted
+
+def _decrypt_with(cipher, encrypted):
+    """Decrypts and unpads ciphertext with a prepared AES-CBC cipher (see _cipher_for)"""
+    # Decrypt
+    decrypted_padded = _decrypt_cbc(cipher, encrypted)
+    
+    # Unpad (PKCS7: the last pad_len bytes all equal pad_len)
+    pad_len = decrypted_padded[-1] if decrypted_padded else 0
+    if not 1 <= pad_len <= AES_BLOCK_SIZE or not decrypted_padded.endswith(bytes((pad_len,)) * pad_len):
+        raise ValueError("Invalid padding bytes.")
+    return decrypted_padded[:-pad_len].decode('utf-8')
 
 def decrypt_text(encrypted_text):
     """Decrypts a string using AES decryption with a salt (compatible with crypto-js)"""
     if not encrypted_text:
         return encrypted_text
     
-    try:
-        # Decode from base64
-        encrypted_data = base64.b64decode(encrypted_text.encode('utf-8'))
-        
-        # Check for "Salted__" prefix (crypto-js format)
-        if encrypted_data.startswith(b'Salted__'):
-            # Extract salt and encrypted data
-            salt = encrypted_data[8:16]  # 8 bytes after "Salted__"
-            encrypted = encrypted_data[16:]  # Rest is encrypted data
-            
-            # Create key and IV using EVP_BytesToKey (OpenSSL compatible)
-            key, iv = _evp_bytes_to_key(ENCRYPTION_SALT.encode(), salt, 32, 16)
-        else:
-            # Fallback to simple approach
-            key = hashlib.sha256(ENCRYPTION_SALT.encode()).digest()
-            iv = encrypted_data[:AES.block_size]
-            encrypted = encrypted_data[AES.block_size:]
-        
-        # Create cipher
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        
-        # Decrypt
-        decrypted_padded = cipher.decrypt(encrypted)
-        
-        # Unpad
-        decrypted_text = unpad(decrypted_padded, AES.block_size).decode('utf-8')
-        
-        return decrypted_text
-    except Exception as e:
-        print(f"Decryption error: {e}")
-        return encrypted_text
+    # Decode from base64
+    encrypted_data = _b64decode(encrypted_text)
+    key, iv, encrypted = _split_payload(encrypted_data)
+    
+    return _decrypt_with(_cipher_for(key, iv), encrypted)
 
-def _evp_bytes_to_key(password, salt, key_len, iv_len):
-    """EVP_BytesToKey implementation compatible with OpenSSL/crypto-js"""
-    d = d_i = b''
-    while len(d) < key_len + iv_len:
-        d_i = hashlib.md5(d_i + password + salt).digest()
-        d += d_i
-    return d[:key_len], d[key_len:key_len + iv_len]
+def _batch_decrypt(encrypted_texts):
+    """Decrypts many strings, sharing one Cipher per distinct key/IV (i.e. per crypto-js salt)"""
+    # Fault tolerance lives here rather than in decrypt_text: a value that fails to decode or
+    # decrypt (binascii.Error, bad padding and bad UTF-8 are all ValueErrors) or is not a
+    # string at all (TypeError, e.g. a numeric UserId) is left as-is
+    decrypted_texts = list(encrypted_texts)
+    
+    # Decode everything first and group ciphertexts by Cipher (one per key/IV)
+    groups = {}
+    for index, encrypted_text in enumerate(encrypted_texts):
+        if not encrypted_text:
+            continue
+        try:
+            key, iv, encrypted = _split_payload(_b64decode(encrypted_text))
+            cipher = _cipher_for(key, iv)
+        except (ValueError, TypeError) as e:
+            logger.warning("Decryption error: %s", e)
+            continue
+        groups.setdefault(cipher, []).append((index, encrypted))
+    
+    # Decrypt each group with its shared Cipher
+    for cipher, items in groups.items():
+        for index, encrypted in items:
+            try:
+                decrypted_texts[index] = _decrypt_with(cipher, encrypted)
+            except ValueError as e:
+                logger.warning("Decryption error: %s", e)
+    
+    return decrypted_texts
+
+@functools.lru_cache(maxsize=512)
+def _evp_bytes_to_key_32_16(password, salt):
+    """EVP_BytesToKey compatible with OpenSSL/crypto-js for AES-256 (32-byte key, 16-byte IV), memoized per salt"""
+    # Each round hashes previous_digest + password + salt, so no MD5 state can be shared
+    # between rounds; join password + salt once and hash that three times
+    data = password + salt
+    md5 = hashlib.md5
+    d1 = md5(data).digest()
+    d2 = md5(d1 + data).digest()
+    d3 = md5(d2 + data).digest()
+    return d1 + d2, d3
 
 def decrypt_alice_blue_accounts(accounts):
     """Decrypts AliceBlue account credentials"""
     if not accounts:
         return accounts
     
-    decrypted_accounts = []
-    for account in accounts:
-        decrypted_account = {
+    # Struct-of-arrays: every UserId goes through one batch and every ApiKey through another,
+    # so accounts whose fields share a crypto-js salt share one Cipher
+    user_ids = _batch_decrypt([account.get('UserId', '') for account in accounts])
+    api_keys = _batch_decrypt([account.get('ApiKey', '') for account in accounts])
+    
+    return [
+        {
             'Name': account.get('Name', ''),
             'Category': account.get('Category', ''),
-            'UserId': decrypt_text(account.get('UserId', '')),
-            'ApiKey': decrypt_text(account.get('ApiKey', ''))
+            'UserId': user_id,
+            'ApiKey': api_key
         }
-        decrypted_accounts.append(decrypted_account)
-    
-    return decrypted_accounts
+        for account, user_id, api_key in zip(accounts, user_ids, api_keys)
+    ]
 
 def is_encrypted(text):
     """Checks if a string appears to be encrypted (base64-like format)"""
-    if not text:
-        return False
-    
-    try:
-        # Check if it looks like base64 encoded data
-        base64.b64decode(text)
-        return len(text) > 20 and text.replace('+', '').replace('/', '').replace('=', '').isalnum()
-    except:
-        return False
+    # Padded base64 is always a multiple of 4 characters; this stands in for the decode
+    # the old check did, without allocating the decoded bytes
+    return bool(text) and len(text) % 4 == 0 and _B64_RE.fullmatch(text) is not None